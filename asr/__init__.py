@@ -1,32 +1,40 @@
-import gevent.monkey
-gevent.monkey.patch_all()
-from email.mime.multipart import MIMEMultipart
-from email.message import Message
 from .model_map import get_model_for_lang
-import json
+import orjson
 import os
+import re
 import struct
-import requests
-import io
-import wave
+import aiohttp
 import time
-import audioop
 import logging
+import numpy as np
 import asyncio
+import contextlib
+import hashlib
+import itertools
+from collections import OrderedDict, deque
+import concurrent.futures
+from concurrent.futures import ThreadPoolExecutor
 from speex import SpeexDecoder
-from flask import Flask, request, Response, abort
+from quart import Quart, request, Response, abort
 
 # Wyoming imports
 try:
     import wyoming
     from wyoming.asr import Transcribe, Transcript
     from wyoming.audio import AudioChunk, AudioStart, AudioStop
-    from wyoming.client import AsyncTcpClient
+    from wyoming.event import async_read_event, async_write_event
     HAS_WYOMING = True
 except ImportError:
     HAS_WYOMING = False
     print("[WARNING] Wyoming package not installed, wyoming-whisper provider will not be available")
 
+# Optional Redis backend for sharing the transcript cache between workers
+try:
+    import redis.asyncio as redis
+    HAS_REDIS = True
+except ImportError:
+    HAS_REDIS = False
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -42,8 +50,15 @@ if DEBUG:
 else:
     logger.setLevel(logging.INFO)
 
-decoder = SpeexDecoder(1)
-app = Flask(__name__)
+app = Quart(__name__)
+
+# Optional parallel Speex decoding of long uploads. Off by default: each range after
+# the first starts on a fresh decoder without the previous frames' history, so the
+# audio at every range boundary differs slightly from a sequential decode, and the
+# speedup depends on the Speex extension releasing the GIL.
+DECODE_WORKERS = int(os.environ.get('DECODE_WORKERS', '1'))
+PARALLEL_DECODE_THRESHOLD = 32
+decode_executor = ThreadPoolExecutor(max_workers=DECODE_WORKERS)
 
 # Get API key from environment, or None if not set
 API_KEY = os.environ.get('ASR_API_KEY')
@@ -51,11 +66,81 @@ API_KEY = os.environ.get('ASR_API_KEY')
 # Get Wyoming connection details from environment
 WYOMING_HOST = os.environ.get('WYOMING_HOST', 'localhost')
 WYOMING_PORT = int(os.environ.get('WYOMING_PORT', '10300'))
+WYOMING_POOL_SIZE = int(os.environ.get('WYOMING_POOL_SIZE', '4'))
+
+# Pulls the multipart boundary out of the request's Content-Type header
+BOUNDARY_RE = re.compile(r'boundary=(?:"([^"]+)"|([^;]+))')
+
+# Nuance-style multipart response, filled in with the part name and JSON payload
+RESPONSE_BOUNDARY = b'--Nuance_NMSP_vutc5w1XobDdefsYG3wq'
+RESPONSE_TEMPLATE = (
+    b'\r\n--%s\r\n'
+    b'Content-Type: application/JSON; charset=utf-8\r\n'
+    b'Content-Disposition: form-data; name="%s"\r\n'
+    b'\r\n'
+    b'%s\r\n'
+    b'--%s--\r\n'
+)
+RESPONSE_MIMETYPE = f'multipart/form-data; boundary={RESPONSE_BOUNDARY.decode()}'
+RETRY_PAYLOAD = orjson.dumps({
+    "Cause": 1,
+    "Name": "AUDIO_INFO",
+    "Prompt": "Sorry, speech not recognized. Please try again."
+})
+
+# Shared HTTP session so provider calls reuse keep-alive TLS connections.
+# Created once the worker's event loop is running, see start_http_session().
+http_session = None
+HTTP_POOL_SIZE = 16
+# Transcription is idempotent, so retrying the POST on gateway errors is safe
+HTTP_RETRIES = 2
+HTTP_RETRY_BACKOFF = 0.2
+HTTP_RETRY_STATUSES = frozenset([502, 503, 504])
+
+# Provider request settings
+ELEVENLABS_URL = "https://api.elevenlabs.io/v1/speech-to-text"
+ELEVENLABS_DATA = {
+    "model_id": "scribe_v1",
+    "tag_audio_events": "false",
+    "timestamps_granularity": "none"
+}
+ELEVENLABS_HEADERS = {
+    "xi-api-key": API_KEY
+}
+GROQ_URL = "https://api.groq.com/openai/v1/audio/transcriptions"
+GROQ_DATA = {
+    "model": "whisper-large-v3",
+    "response_format": "json"
+}
+GROQ_HEADERS = {
+    "Authorization": f"Bearer {API_KEY}"
+}
+
+# Concurrent provider calls can be collected for up to this long and sent together.
+# Requests already overlap on the shared connection pool, so this only adds
+# latency unless the provider benefits from bursts; off by default.
+ASR_BATCH_WINDOW_MS = int(os.environ.get('ASR_BATCH_WINDOW_MS', '0'))
+ASR_BATCH_MAX = int(os.environ.get('ASR_BATCH_MAX', str(HTTP_POOL_SIZE)))
+
+# Transcript cache settings
+ASR_CACHE_SIZE = int(os.environ.get('ASR_CACHE_SIZE', '1024'))
+ASR_CACHE_REDIS_URL = os.environ.get('ASR_CACHE_REDIS_URL')
+ASR_CACHE_TTL = int(os.environ.get('ASR_CACHE_TTL', '86400'))
 
 # Audio settings for Wyoming
 SAMPLE_RATE = 16000
 SAMPLE_WIDTH = 2
 SAMPLE_CHANNELS = 1
+# 30ms of audio per AudioChunk sent to Wyoming
+WYOMING_CHUNK_BYTES = SAMPLE_RATE * SAMPLE_WIDTH * SAMPLE_CHANNELS * 30 // 1000
+
+# Providers that need a WAV container; everything else is sent raw PCM
+WAV_PROVIDERS = frozenset(['elevenlabs', 'groq'])
+WAV_HEADER = struct.Struct('<4sI4s4sIHHIIHH4sI')
+
+# Volume boost applied to decoded Speex audio
+AUDIO_GAIN = 7
+GAIN_LIMIT = np.iinfo(np.int16).max // AUDIO_GAIN
 
 # Determine which provider to use
 if not API_KEY and os.environ.get('ASR_API_PROVIDER') != 'wyoming-whisper':
@@ -73,56 +158,372 @@ if ASR_API_PROVIDER == 'wyoming-whisper' and not HAS_WYOMING:
     raise Exception("Wyoming-whisper selected but Wyoming package not installed.")
 
 
-# We know gunicorn does this, but it doesn't *say* it does this, so we must signal it manually.
-@app.before_request
-def handle_chunking():
-    request.environ['wsgi.input_terminated'] = 1
+class WyomingConnection:
+    """TCP connection to a Wyoming service that can report whether it is still open."""
 
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
 
-def parse_chunks(stream):
-    boundary = b'--' + request.headers['content-type'].split(';')[1].split('=')[1].encode('utf-8').strip()  # super lazy/brittle parsing.
-    this_frame = b''
-    while True:
-        content = stream.read(4096)
-        this_frame += content
-        end = this_frame.find(boundary)
-        if end > -1:
-            frame = this_frame[:end]
-            this_frame = this_frame[end + len(boundary):]
-            if frame != b'':
+    async def read_event(self):
+        return await async_read_event(self.reader)
+
+    async def write_event(self, event):
+        await async_write_event(event, self.writer)
+
+    def usable(self):
+        # Servers such as wyoming-faster-whisper hang up after every transcript
+        return not self.reader.at_eof() and not self.writer.is_closing()
+
+    async def close(self):
+        self.writer.close()
+        with contextlib.suppress(Exception):
+            await self.writer.wait_closed()
+
+
+class WyomingPool:
+    """Pool of warm connections to a Wyoming service."""
+
+    def __init__(self, host, port, size):
+        self.host = host
+        self.port = port
+        self.size = size
+        self.slots = None
+        self.idle = deque()
+
+    async def _connect(self):
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        return WyomingConnection(reader, writer)
+
+    @contextlib.asynccontextmanager
+    async def acquire(self, fresh=False):
+        # The semaphore must be created on the loop that uses it
+        if self.slots is None:
+            self.slots = asyncio.Semaphore(self.size)
+
+        async with self.slots:
+            client = None
+            while self.idle and not fresh:
+                candidate = self.idle.popleft()
+                if candidate.usable():
+                    client = candidate
+                    break
+                await candidate.close()
+            if client is None:
+                client = await self._connect()
+
+            try:
+                yield client
+            except BaseException:
+                await client.close()
+                raise
+
+            if client.usable():
+                self.idle.append(client)
+            else:
+                await client.close()
+
+    async def close(self):
+        while self.idle:
+            await self.idle.popleft().close()
+
+
+class WyomingConnectionLost(Exception):
+    pass
+
+
+wyoming_pool = WyomingPool(WYOMING_HOST, WYOMING_PORT, WYOMING_POOL_SIZE)
+
+
+class TranscriptCache:
+    """LRU cache of transcripts keyed by a hash of the decoded audio."""
+
+    def __init__(self, size, redis_url=None, ttl=None):
+        self.size = size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.redis = redis.Redis.from_url(redis_url) if redis_url else None
+
+    @staticmethod
+    def key(pcm_data):
+        return hashlib.blake2b(pcm_data, digest_size=16).digest()
+
+    async def get(self, key):
+        transcript = self.entries.get(key)
+        if transcript is not None:
+            self.entries.move_to_end(key)
+            return transcript
+        if self.redis is not None:
+            try:
+                cached = await self.redis.get(self._redis_key(key))
+            except redis.RedisError as e:
+                logger.error(f"Transcript cache error: {e}")
+                return None
+            if cached is not None:
+                transcript = cached.decode('utf-8')
+                self._store(key, transcript)
+                return transcript
+        return None
+
+    async def put(self, key, transcript):
+        self._store(key, transcript)
+        if self.redis is not None:
+            try:
+                await self.redis.set(self._redis_key(key), transcript.encode('utf-8'), ex=self.ttl)
+            except redis.RedisError as e:
+                logger.error(f"Transcript cache error: {e}")
+
+    def _store(self, key, transcript):
+        if self.size <= 0:
+            return
+        self.entries[key] = transcript
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+    @staticmethod
+    def _redis_key(key):
+        return f"rebble-asr:{ASR_API_PROVIDER}:".encode('utf-8') + key
+
+
+if ASR_CACHE_REDIS_URL and not HAS_REDIS:
+    raise Exception("ASR_CACHE_REDIS_URL set but redis package not installed.")
+
+transcript_cache = TranscriptCache(ASR_CACHE_SIZE, ASR_CACHE_REDIS_URL, ASR_CACHE_TTL)
+
+
+class TranscriptionBatcher:
+    """Micro-batches provider calls so bursts of requests go out together over the warm pool."""
+
+    def __init__(self, window_ms, max_batch):
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self.queue = None
+        self.worker = None
+        self.in_flight = set()
+
+    def start(self):
+        # With batching disabled submit() calls straight through, so there is nothing to run
+        if self.window <= 0:
+            return
+        self.queue = asyncio.Queue()
+        self.worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.worker is None:
+            return
+        # The sentinel lets the worker send the batch it is collecting before exiting
+        self.queue.put_nowait(None)
+        await self.worker
+        # Let batches already sent finish before the HTTP session is closed
+        await asyncio.gather(*self.in_flight, return_exceptions=True)
+        while not self.queue.empty():
+            _, _, future = self.queue.get_nowait()
+            future.cancel()
+
+    async def submit(self, transcribe, wav_data):
+        if self.window <= 0:
+            return await transcribe(wav_data)
+        future = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait((transcribe, wav_data, future))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            job = await self.queue.get()
+            if job is None:
+                return
+            batch = [job]
+            deadline = loop.time() + self.window
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
                 try:
-                    header, content = frame.split(b'\r\n\r\n', 1)
-                except ValueError:
-                    continue
-                yield content[:-2]
-        if content == b'':
-            print("End of input.")
+                    job = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if job is None:
+                    stopping = True
+                    break
+                batch.append(job)
+
+            if DEBUG:
+                logger.debug(f"Sending batch of {len(batch)} transcription requests")
+
+            # Don't hold up collecting the next batch while this one is in flight
+            task = asyncio.create_task(self._send(batch))
+            self.in_flight.add(task)
+            task.add_done_callback(self.in_flight.discard)
+
+    @staticmethod
+    async def _send(batch):
+        results = await asyncio.gather(
+            *(transcribe(wav_data) for transcribe, wav_data, _ in batch),
+            return_exceptions=True,
+        )
+        for (_, _, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+
+transcription_batcher = TranscriptionBatcher(ASR_BATCH_WINDOW_MS, ASR_BATCH_MAX)
+
+
+@app.before_serving
+async def start_http_session():
+    global http_session
+    http_session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=HTTP_POOL_SIZE))
+    transcription_batcher.start()
+
+
+@app.after_serving
+async def close_http_session():
+    await transcription_batcher.stop()
+    await http_session.close()
+    await wyoming_pool.close()
+    if transcript_cache.redis is not None:
+        await transcript_cache.redis.aclose()
+
+
+def parse_chunks(body, boundary):
+    # Frames are yielded as memoryview slices of the request body, so nothing is copied here
+    view = memoryview(body)
+    boundary_len = len(boundary)
+    start = 0
+    while True:
+        end = body.find(boundary, start)
+        if end == -1:
             break
+        if end > start:
+            header_end = body.find(b'\r\n\r\n', start, end)
+            if header_end != -1:
+                yield view[header_end + 4:end - 2]
+        start = end + boundary_len
+    print("End of input.")
+
+class FrameSizeMismatch(Exception):
+    pass
+
+
+def trim_chunks(frames):
+    # The first 3 frames are always dropped. If more than 15 remain, the next 12
+    # and the last 3 go too, all without first collecting every frame into a list.
+    frames = itertools.islice(frames, 3, None)
+    head = list(itertools.islice(frames, 16))
+    if len(head) <= 15:
+        return head
+
+    chunks = head[12:]
+    chunks.extend(frames)
+    del chunks[-3:]
+    return chunks
+
+def decode_range(chunks, out, frame_bytes, range_decoder=None):
+    # Speex decoders carry state between frames, so each contiguous range gets its own.
+    if range_decoder is None:
+        range_decoder = SpeexDecoder(1)
+    for i, chunk in enumerate(chunks):
+        decoded = range_decoder.decode(bytes(chunk))
+        if len(decoded) != frame_bytes:
+            raise FrameSizeMismatch(f"Decoded frame is {len(decoded)} bytes, expected {frame_bytes}")
+        out[i * frame_bytes:(i + 1) * frame_bytes] = np.frombuffer(decoded, dtype=np.uint8)
 
-def elevenlabs_transcribe(wav_buffer):
+def decode_chunks(chunks):
+    try:
+        return decode_chunks_preallocated(chunks)
+    except FrameSizeMismatch as e:
+        # Fall back to joining whatever each frame decodes to
+        logger.warning(f"{e}, decoding sequentially instead")
+        fallback_decoder = SpeexDecoder(1)
+        pcm_raw = b''.join(fallback_decoder.decode(bytes(chunk)) for chunk in chunks)
+        return np.frombuffer(pcm_raw, dtype='<i2').copy()
+
+def decode_chunks_preallocated(chunks):
+    if not chunks:
+        return np.empty(0, dtype='<i2')
+
+    # Every frame decodes to the same number of samples, so probe the first one and
+    # decode everything straight into a single preallocated buffer.
+    first_decoder = SpeexDecoder(1)
+    first = first_decoder.decode(bytes(chunks[0]))
+    frame_bytes = len(first)
+    pcm = np.empty(len(chunks) * frame_bytes // SAMPLE_WIDTH, dtype='<i2')
+    pcm_view = pcm.view(np.uint8)
+    pcm_view[:frame_bytes] = np.frombuffer(first, dtype=np.uint8)
+
+    if len(chunks) <= PARALLEL_DECODE_THRESHOLD or DECODE_WORKERS < 2:
+        decode_range(chunks[1:], pcm_view[frame_bytes:], frame_bytes, first_decoder)
+        return pcm
+
+    # Split into contiguous ranges, each writing to its own slice of the buffer.
+    # The first range carries on with the decoder used for probing.
+    step = -(-len(chunks) // DECODE_WORKERS)
+    futures = [decode_executor.submit(decode_range, chunks[1:step], pcm_view[frame_bytes:step * frame_bytes], frame_bytes, first_decoder)]
+    for start in range(step, len(chunks), step):
+        futures.append(decode_executor.submit(
+            decode_range, chunks[start:start + step], pcm_view[start * frame_bytes:(start + step) * frame_bytes], frame_bytes))
+    # Let every range finish before surfacing any error, so none still writes to the buffer
+    concurrent.futures.wait(futures)
+    for future in futures:
+        future.result()
+    return pcm
+
+def decode_audio(chunks):
+    pcm = decode_chunks(chunks)
+    # Boosting the audio volume in place. Clipping first keeps the multiply from
+    # overflowing int16, so loud samples saturate at +/-32767.
+    np.clip(pcm, -GAIN_LIMIT, GAIN_LIMIT, out=pcm)
+    np.multiply(pcm, AUDIO_GAIN, out=pcm, casting='unsafe')
+    return pcm.tobytes()
+
+def build_wav(pcm_data):
+    # Create WAV file in memory: a fixed 44-byte RIFF header followed by the PCM
+    wav_start_time = time.time()
+    header = WAV_HEADER.pack(
+        b'RIFF', 36 + len(pcm_data), b'WAVE',
+        b'fmt ', 16, 1, SAMPLE_CHANNELS, SAMPLE_RATE,
+        SAMPLE_RATE * SAMPLE_CHANNELS * SAMPLE_WIDTH, SAMPLE_CHANNELS * SAMPLE_WIDTH, SAMPLE_WIDTH * 8,
+        b'data', len(pcm_data),
+    )
+    wav_data = header + pcm_data
+
+    if DEBUG:
+        wav_process_time = time.time() - wav_start_time
+        logger.debug(f"Created WAV file in {wav_process_time:.3f}s")
+        logger.debug(f"WAV file size: {len(wav_data)} bytes")
+
+    return wav_data
+
+async def post_transcription(url, wav_data, data, headers):
+    for attempt in range(HTTP_RETRIES + 1):
+        # Form bodies are consumed when sent, so build a fresh one per attempt
+        form = aiohttp.FormData()
+        form.add_field("file", wav_data, filename="audio.wav", content_type="audio/wav")
+        for name, value in data.items():
+            form.add_field(name, value)
+
+        async with http_session.post(url, data=form, headers=headers) as response_api:
+            if response_api.status in HTTP_RETRY_STATUSES and attempt < HTTP_RETRIES:
+                await asyncio.sleep(HTTP_RETRY_BACKOFF * 2 ** attempt)
+                continue
+            response_api.raise_for_status()
+            return await response_api.json()
+
+async def elevenlabs_transcribe(wav_data):
     try:
         if DEBUG:
             logger.debug("Starting ElevenLabs transcription")
             api_start_time = time.time()
 
         # Create transcription via the ElevenLabs API
-        TRANSCIPTION_URL = "https://api.elevenlabs.io/v1/speech-to-text"
-
-        files = {
-            "file": ("audio.wav", wav_buffer, "audio/wav")
-        }
-        data = {
-            "model_id": "scribe_v1",
-            "tag_audio_events": "false",
-            "timestamps_granularity": "none"
-        }
-        headers = {
-            "xi-api-key": API_KEY
-        }
-
-        response_api = requests.post(TRANSCIPTION_URL, files=files, data=data, headers=headers)
-        response_api.raise_for_status()
-        transcription = response_api.json()
+        transcription = await post_transcription(ELEVENLABS_URL, wav_data, ELEVENLABS_DATA, ELEVENLABS_HEADERS)
 
         if DEBUG:
             api_time = time.time() - api_start_time
@@ -130,33 +531,18 @@ def elevenlabs_transcribe(wav_buffer):
 
         return transcription.get("text", "")
 
-    except requests.exceptions.RequestException as e:
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
         logger.error(f"ElevenLabs transcription error: {e}")
         return None
 
-def groq_transcribe(wav_buffer):
+async def groq_transcribe(wav_data):
     try:
         if DEBUG:
             logger.debug("Starting Groq transcription")
             api_start_time = time.time()
 
         # Create transcription via the Groq API
-        TRANSCIPTION_URL = "https://api.groq.com/openai/v1/audio/transcriptions"
-
-        files = {
-            "file": ("audio.wav", wav_buffer, "audio/wav")
-        }
-        data = {
-            "model": "whisper-large-v3",
-            "response_format": "json"
-        }
-        headers = {
-            "Authorization": f"Bearer {API_KEY}"
-        }
-
-        response_api = requests.post(TRANSCIPTION_URL, files=files, data=data, headers=headers)
-        response_api.raise_for_status()
-        transcription = response_api.json()
+        transcription = await post_transcription(GROQ_URL, wav_data, GROQ_DATA, GROQ_HEADERS)
 
         if DEBUG:
             api_time = time.time() - api_start_time
@@ -164,11 +550,11 @@ def groq_transcribe(wav_buffer):
 
         return transcription.get("text", "")
 
-    except requests.exceptions.RequestException as e:
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
         logger.error(f"Groq transcription error: {e}")
         return None
 
-def wyoming_whisper_transcribe(wav_buffer):
+async def wyoming_whisper_transcribe(pcm_data):
     try:
         if not HAS_WYOMING:
             logger.error("Wyoming package not installed, cannot use wyoming-whisper")
@@ -179,85 +565,11 @@ def wyoming_whisper_transcribe(wav_buffer):
             logger.debug(f"Wyoming host: {WYOMING_HOST}, port: {WYOMING_PORT}")
             wyoming_start_time = time.time()
 
-        # Reset buffer position and read the audio data
-        wav_buffer.seek(0)
-
-        # Parse the WAV file to get just the PCM data
-        with wave.open(wav_buffer, 'rb') as wav_file:
-            audio_data = wav_file.readframes(wav_file.getnframes())
-            if DEBUG:
-                logger.debug(f"Extracted {len(audio_data)} bytes of PCM data from WAV")
-
-        # Since we need to use asyncio, we need to create and run an async function
-        async def process_with_wyoming():
-            connection_start_time = time.time() if DEBUG else 0
-            try:
-                # Connect to Wyoming service
-                async with AsyncTcpClient(WYOMING_HOST, WYOMING_PORT) as client:
-                    if DEBUG:
-                        connection_time = time.time() - connection_start_time
-                        logger.debug(f"Connected to Wyoming service in {connection_time:.3f}s")
-
-                    # Set transcription language (using default as we don't have language info)
-                    await client.write_event(Transcribe(language=None).event())
-
-                    # Begin audio stream
-                    await client.write_event(
-                        AudioStart(
-                            rate=SAMPLE_RATE,
-                            width=SAMPLE_WIDTH,
-                            channels=SAMPLE_CHANNELS,
-                        ).event()
-                    )
-
-                    if DEBUG:
-                        logger.debug(f"Sending {len(audio_data)} bytes to Wyoming service")
-
-                    # Send audio data
-                    chunk = AudioChunk(
-                        rate=SAMPLE_RATE,
-                        width=SAMPLE_WIDTH,
-                        channels=SAMPLE_CHANNELS,
-                        audio=audio_data,
-                    )
-                    await client.write_event(chunk.event())
-
-                    # End audio stream
-                    await client.write_event(AudioStop().event())
-
-                    if DEBUG:
-                        logger.debug("Waiting for transcription result")
-
-                    # Wait for transcription result
-                    while True:
-                        event = await client.read_event()
-                        if event is None:
-                            logger.error("Wyoming connection lost")
-                            return None
-
-                        if Transcript.is_type(event.type):
-                            transcript = Transcript.from_event(event)
-                            if DEBUG:
-                                logger.debug(f"Received transcript from Wyoming service: '{transcript.text}'")
-                            return transcript.text
-            except Exception as e:
-                logger.error(f"Wyoming transcription error: {e}")
-                if DEBUG:
-                    import traceback
-                    logger.debug(traceback.format_exc())
-                return None
-
-        # Run the async function in an event loop
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        try:
-            result = loop.run_until_complete(process_with_wyoming())
-            if DEBUG:
-                wyoming_time = time.time() - wyoming_start_time
-                logger.debug(f"Wyoming-whisper transcription completed in {wyoming_time:.3f}s")
-            return result
-        finally:
-            loop.close()
+        result = await process_with_wyoming(pcm_data)
+        if DEBUG:
+            wyoming_time = time.time() - wyoming_start_time
+            logger.debug(f"Wyoming-whisper transcription completed in {wyoming_time:.3f}s")
+        return result
 
     except Exception as e:
         logger.error(f"Wyoming-whisper transcription error: {e}")
@@ -266,12 +578,81 @@ def wyoming_whisper_transcribe(wav_buffer):
             logger.debug(traceback.format_exc())
         return None
 
+async def wyoming_request(client, audio_data):
+    # Set transcription language (using default as we don't have language info)
+    await client.write_event(Transcribe(language=None).event())
+
+    # Begin audio stream
+    await client.write_event(
+        AudioStart(
+            rate=SAMPLE_RATE,
+            width=SAMPLE_WIDTH,
+            channels=SAMPLE_CHANNELS,
+        ).event()
+    )
+
+    if DEBUG:
+        logger.debug(f"Sending {len(audio_data)} bytes to Wyoming service")
+
+    # Stream audio in short frames so the server can start work before the upload ends
+    for offset in range(0, len(audio_data), WYOMING_CHUNK_BYTES):
+        chunk = AudioChunk(
+            rate=SAMPLE_RATE,
+            width=SAMPLE_WIDTH,
+            channels=SAMPLE_CHANNELS,
+            audio=audio_data[offset:offset + WYOMING_CHUNK_BYTES],
+        )
+        await client.write_event(chunk.event())
+
+    # End audio stream
+    await client.write_event(AudioStop().event())
+
+    if DEBUG:
+        logger.debug("Waiting for transcription result")
+
+    # Wait for transcription result
+    while True:
+        event = await client.read_event()
+        if event is None:
+            raise WyomingConnectionLost("Wyoming connection lost")
+
+        if Transcript.is_type(event.type):
+            transcript = Transcript.from_event(event)
+            if DEBUG:
+                logger.debug(f"Received transcript from Wyoming service: '{transcript.text}'")
+            return transcript.text
+
+async def process_with_wyoming(audio_data):
+    # A pooled connection may have been closed by the server since its last use,
+    # so a failure gets one retry on a newly opened connection.
+    for attempt in range(2):
+        connection_start_time = time.time() if DEBUG else 0
+        try:
+            async with wyoming_pool.acquire(fresh=attempt > 0) as client:
+                if DEBUG:
+                    connection_time = time.time() - connection_start_time
+                    logger.debug(f"Acquired Wyoming connection in {connection_time:.3f}s")
+                return await wyoming_request(client, audio_data)
+        except Exception as e:
+            if attempt == 0 and isinstance(e, (WyomingConnectionLost, ConnectionError)):
+                logger.debug(f"Discarding stale Wyoming connection: {e}")
+                continue
+            logger.error(f"Wyoming transcription error: {e}")
+            if DEBUG:
+                import traceback
+                logger.debug(traceback.format_exc())
+            return None
+
+# Heartbeats are hit constantly, so they all share one prebuilt response
+HEARTBEAT_RESPONSE = Response('asr', content_type='text/plain; charset=utf-8')
+
+
 @app.route('/heartbeat')
-def heartbeat():
-    return 'asr'
+async def heartbeat():
+    return HEARTBEAT_RESPONSE
 
 @app.route('/NmspServlet/', methods=["POST"])
-def recognise():
+async def recognise():
     # Track total processing time
     start_time = time.time()
 
@@ -279,47 +660,26 @@ def recognise():
         logger.debug(f"Received request from: {request.remote_addr}")
         logger.debug(f"Request headers: {dict(request.headers)}")
 
-    stream = request.stream
-
-    chunks = list(parse_chunks(stream))
-    chunks = chunks[3:]
-    pcm_data = bytearray()
+    boundary_match = BOUNDARY_RE.search(request.headers.get('content-type', ''))
+    if boundary_match is None:
+        logger.error("Request has no multipart boundary")
+        abort(400)
+    boundary = b'--' + (boundary_match.group(1) or boundary_match.group(2)).strip().encode('utf-8')
 
-    if len(chunks) > 15:
-        chunks = chunks[12:-3]
+    body = await request.get_data(cache=False)
+    chunks = trim_chunks(parse_chunks(body, boundary))
 
     if DEBUG:
         logger.debug(f"Received {len(chunks)} audio chunks")
 
     chunk_process_start = time.time()
-    for i, chunk in enumerate(chunks):
-        decoded = decoder.decode(chunk)
-        # Boosting the audio volume
-        decoded = audioop.mul(decoded, 2, 7)
-        # Directly append decoded audio bytes
-        pcm_data.extend(decoded)
+    # Decoding is CPU-bound, keep it off the event loop
+    pcm_data = await asyncio.to_thread(decode_audio, chunks)
 
     if DEBUG:
         chunk_process_time = time.time() - chunk_process_start
         logger.debug(f"Processed {len(chunks)} chunks in {chunk_process_time:.3f}s")
         logger.debug(f"PCM data size: {len(pcm_data)} bytes")
-
-    # Create WAV file in memory
-    wav_start_time = time.time()
-    wav_buffer = io.BytesIO()
-    with wave.open(wav_buffer, 'wb') as wav_file:
-        wav_file.setnchannels(1)
-        wav_file.setsampwidth(2)
-        wav_file.setframerate(16000)
-        wav_file.writeframes(pcm_data)
-
-    wav_buffer.seek(0)
-    wav_size = wav_buffer.getbuffer().nbytes
-
-    if DEBUG:
-        wav_process_time = time.time() - wav_start_time
-        logger.debug(f"Created WAV file in {wav_process_time:.3f}s")
-        logger.debug(f"WAV file size: {wav_size} bytes")
         logger.debug(f"Audio duration: ~{len(pcm_data)/16000/2:.2f}s at 16kHz")
 
     # Initialize transcript variable
@@ -330,22 +690,33 @@ def recognise():
     # Track transcription time
     transcription_start = time.time()
 
-    if ASR_API_PROVIDER == 'elevenlabs':
-        if not API_KEY:
-            raise Exception("ElevenLabs requires an API key. Please provide one.")
-        else:
-            transcript = elevenlabs_transcribe(wav_buffer)
-    elif ASR_API_PROVIDER == 'groq':
-        if not API_KEY:
-            raise Exception("Groq requires an API key. Please provide one.")
-        else:
-            transcript = groq_transcribe(wav_buffer)
-    elif ASR_API_PROVIDER == 'wyoming-whisper':
-        transcript = wyoming_whisper_transcribe(wav_buffer)
-        if transcript is None:
-            logger.error("Wyoming-whisper transcription failed.")
+    cache_key = transcript_cache.key(pcm_data)
+    transcript = await transcript_cache.get(cache_key)
+    if transcript is not None:
+        logger.info("Transcript cache hit")
     else:
-        logger.error(f"Invalid ASR API provider: {ASR_API_PROVIDER}.")
+        # Only HTTP providers get a WAV; Wyoming takes the raw PCM as-is
+        audio_data = build_wav(pcm_data) if ASR_API_PROVIDER in WAV_PROVIDERS else pcm_data
+
+        if ASR_API_PROVIDER == 'elevenlabs':
+            if not API_KEY:
+                raise Exception("ElevenLabs requires an API key. Please provide one.")
+            else:
+                transcript = await transcription_batcher.submit(elevenlabs_transcribe, audio_data)
+        elif ASR_API_PROVIDER == 'groq':
+            if not API_KEY:
+                raise Exception("Groq requires an API key. Please provide one.")
+            else:
+                transcript = await transcription_batcher.submit(groq_transcribe, audio_data)
+        elif ASR_API_PROVIDER == 'wyoming-whisper':
+            transcript = await wyoming_whisper_transcribe(audio_data)
+            if transcript is None:
+                logger.error("Wyoming-whisper transcription failed.")
+        else:
+            logger.error(f"Invalid ASR API provider: {ASR_API_PROVIDER}.")
+
+        if transcript is not None:
+            await transcript_cache.put(cache_key, transcript)
 
     transcription_time = time.time() - transcription_start
 
@@ -355,44 +726,26 @@ def recognise():
         abort(500)
 
     logger.info(f"Transcript: '{transcript}' (took {transcription_time:.3f}s)")
-    words = []
-    for word in transcript.split():
-        words.append({
-            'word': word,
-            'confidence': 1.0
-        })
+    words = [{'word': word, 'confidence': 1.0} for word in transcript.split()]
 
     # Now create a MIME multipart response
-    parts = MIMEMultipart()
-    response_part = Message()
-    response_part.add_header('Content-Type', 'application/JSON; charset=utf-8')
-
     if len(words) > 0:
-        response_part.add_header('Content-Disposition', 'form-data; name="QueryResult"')
-        # Append the no-space marker and uppercase the first character
-        words[0]['word'] += '\\*no-space-before'
-        words[0]['word'] = words[0]['word'][0].upper() + words[0]['word'][1:]
-        payload = json.dumps({'words': [words]})
+        name = b'QueryResult'
+        # Uppercase the first character and append the no-space marker
+        first = words[0]['word']
+        words[0]['word'] = f"{first[0].upper()}{first[1:]}\\*no-space-before"
+        payload = orjson.dumps({'words': [words]})
         #print(f"[DEBUG] Payload for QueryResult: {payload}")
     else:
-        response_part.add_header('Content-Disposition', 'form-data; name="QueryRetry"')
-        payload = json.dumps({
-            "Cause": 1,
-            "Name": "AUDIO_INFO",
-            "Prompt": "Sorry, speech not recognized. Please try again."
-        })
+        name = b'QueryRetry'
+        payload = RETRY_PAYLOAD
         #print(f"[DEBUG] Payload for QueryRetry: {payload}")
 
-    response_part.set_payload(payload)
-    parts.attach(response_part)
-
-    parts.set_boundary('--Nuance_NMSP_vutc5w1XobDdefsYG3wq')
-    response_text = '\r\n' + parts.as_string().split("\n", 3)[3].replace('\n', '\r\n')
+    response_body = RESPONSE_TEMPLATE % (RESPONSE_BOUNDARY, name, payload, RESPONSE_BOUNDARY)
     if DEBUG:
-        logger.debug(f"Final response text prepared with boundary: {parts.get_boundary()}")
+        logger.debug(f"Final response text prepared with boundary: {RESPONSE_BOUNDARY.decode()}")
 
-    response = Response(response_text)
-    response.headers['Content-Type'] = f'multipart/form-data; boundary={parts.get_boundary()}'
+    response = Response(response_body, mimetype=RESPONSE_MIMETYPE)
 
     # Log total processing time
     total_time = time.time() - start_time
@@ -1,3 +1,5 @@
+from functools import lru_cache
+
 MODEL_MAP = {
     'af-za': 'default',  # latest_short not supported
     'cs-cz': 'latest_short',
@@ -44,5 +46,6 @@ MODEL_MAP = {
 }
 
 
+@lru_cache(maxsize=128)
 def get_model_for_lang(code: str) -> str:
     return MODEL_MAP.get(code.lower(), 'default')
@@ -53,10 +53,13 @@
             ];
 
             propagatedBuildInputs = with pkgs.python3Packages; [
-              flask
-              gevent
+              aiohttp
               gunicorn
-              requests
+              numpy
+              orjson
+              quart
+              uvicorn
+              uvicorn-worker
               self.packages.${system}.rebble-speex
               wyoming
             ];
@@ -64,6 +67,8 @@
             installPhase = ''
               mkdir -p $out/lib/${pkgs.python3.libPrefix}/site-packages/rebble-asr
               cp -r asr/* $out/lib/${pkgs.python3.libPrefix}/site-packages/rebble-asr
+              mkdir -p $out/share/rebble-asr
+              cp gunicorn.conf.py $out/share/rebble-asr/gunicorn.conf.py
             '';
           };
 
@@ -125,7 +130,7 @@
 
               serviceConfig = {
                 DynamicUser = true;
-                ExecStart = "${python}/bin/python -m gunicorn -k gevent -b ${cfg.bind} asr:app";
+                ExecStart = "${python}/bin/python -m gunicorn -c ${self.packages.${pkgs.system}.rebble-asr}/share/rebble-asr/gunicorn.conf.py -b ${cfg.bind} asr:app";
                 EnvironmentFile = "${cfg.environmentFile}";
               };
             };
@@ -0,0 +1,17 @@
+# Gunicorn settings for rebble-asr. Picked up automatically when gunicorn is
+# started from the repository root, or pass it explicitly with `-c`.
+import multiprocessing
+import os
+
+# Requests spend most of their time waiting on the ASR provider, so each
+# worker runs an asyncio event loop and overlaps many requests at once. One
+# worker per core is enough; more would only split the per-worker transcript
+# cache and connection pools and multiply the decode threads.
+worker_class = 'uvicorn_worker.UvicornWorker'
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+
+# Seconds a worker may go without heartbeating the arbiter before it is
+# killed and restarted. Async workers heartbeat from their event loop, so this
+# does not limit how long a request can take.
+timeout = 60
+keepalive = 30